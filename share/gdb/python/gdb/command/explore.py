@@ -17,47 +17,54 @@
 """Implementation of the GDB 'explore' command using the GDB Python API."""
 
 import gdb
+import re
 import sys
 
 if sys.version_info[0] > 2:
     # Python 3 renamed raw_input to input
     raw_input = input
-    
+
+# Matches any character which cannot appear in a plain identifier-like
+# expression, i.e. one which needs to be parenthesized before indexing.
+_NON_IDENT_CHAR_RE = re.compile(r'[^A-Za-z0-9_]')
+
 class Explorer(object):
     """Internal class which invokes other explorers."""
 
-    # This map is filled by the Explorer.init_env() function
+    __slots__ = ()
+
+    # These maps are filled by the Explorer.init_env() function
     type_code_to_explorer_map = { }
+    type_code_to_expr_explorer_map = { }
+    type_code_to_type_explorer_map = { }
 
-    _SCALAR_TYPE_LIST = (
+    # Cache of the strings of the gdb.Type values displayed while exploring,
+    # keyed by the id of the gdb.Type object.  The object is held along
+    # with its string so that its id cannot be reused while it is cached.
+    # It is cleared by ExploreUtils.clear_caches at the end of each explore
+    # command.
+    _type_str_cache = { }
+
+    _SCALAR_TYPE_SET = frozenset((
         gdb.TYPE_CODE_CHAR,
         gdb.TYPE_CODE_INT,
         gdb.TYPE_CODE_BOOL,
         gdb.TYPE_CODE_FLT,
         gdb.TYPE_CODE_VOID,
         gdb.TYPE_CODE_ENUM,
-    )
+    ))
+
+    _REFERENCE_TYPE_SET = frozenset((
+        gdb.TYPE_CODE_REF,
+        gdb.TYPE_CODE_RVALUE_REF,
+    ))
 
     @staticmethod
     def guard_expr(expr):
-        length = len(expr)
-        guard = False
-
-        if expr[0] == '(' and expr[length-1] == ')':
-            pass
-        else:
-            i = 0
-            while i < length:
-                c = expr[i]
-                if (c == '_' or ('a' <= c and c <= 'z') or
-                    ('A' <= c and c <= 'Z') or ('0' <= c and c <= '9')):
-                    pass
-                else:
-                    guard = True
-                    break
-                i += 1
+        if expr.startswith('(') and expr.endswith(')'):
+            return expr
 
-        if guard:
+        if _NON_IDENT_CHAR_RE.search(expr):
             return "(" + expr + ")"
         else:
             return expr
@@ -79,14 +86,31 @@ class Explorer(object):
         Returns:
             No return value.
         """
-        type_code = value.type.code
-        if type_code in Explorer.type_code_to_explorer_map:
-            explorer_class = Explorer.type_code_to_explorer_map[type_code]
-            while explorer_class.explore_expr(expr, value, is_child):
+        datatype = value.type
+        type_code = datatype.code
+        # Look through typedefs and references here instead of dispatching
+        # to separate explorers which would recurse back into this function.
+        while True:
+            if type_code == gdb.TYPE_CODE_TYPEDEF:
+                actual_type = datatype.strip_typedefs()
+                print ("The value of '%s' is of type '%s' "
+                       "which is a typedef of type '%s'" %
+                       (expr, str(datatype), str(actual_type)))
+                value = value.cast(actual_type)
+            elif type_code in Explorer._REFERENCE_TYPE_SET:
+                value = value.referenced_value()
+            else:
+                break
+            datatype = value.type
+            type_code = datatype.code
+
+        explore_fn = Explorer.type_code_to_expr_explorer_map.get(type_code)
+        if explore_fn is not None:
+            while explore_fn(expr, value, is_child):
                 pass
         else:
             print ("Explorer for type '%s' not yet available.\n" %
-                   str(value.type))
+                   str(datatype))
 
     @staticmethod
     def explore_type(name, datatype, is_child):
@@ -106,9 +130,27 @@ class Explorer(object):
             No return value.
         """
         type_code = datatype.code
-        if type_code in Explorer.type_code_to_explorer_map:
-            explorer_class = Explorer.type_code_to_explorer_map[type_code]
-            while explorer_class.explore_type(name, datatype, is_child):
+        # Look through typedefs and references here instead of dispatching
+        # to separate explorers which would recurse back into this function.
+        while True:
+            if type_code == gdb.TYPE_CODE_TYPEDEF:
+                actual_type = datatype.strip_typedefs()
+                if is_child:
+                    print ("The type of %s is a typedef of type '%s'." %
+                           (name, str(actual_type)))
+                else:
+                    print ("The type '%s' is a typedef of type '%s'." %
+                           (name, str(actual_type)))
+                datatype = actual_type
+            elif type_code in Explorer._REFERENCE_TYPE_SET:
+                datatype = datatype.target()
+            else:
+                break
+            type_code = datatype.code
+
+        explore_fn = Explorer.type_code_to_type_explorer_map.get(type_code)
+        if explore_fn is not None:
+            while explore_fn(name, datatype, is_child):
                 pass
         else:
             print ("Explorer for type '%s' not yet available.\n" %
@@ -131,11 +173,33 @@ class Explorer(object):
             gdb.TYPE_CODE_STRUCT : CompoundExplorer,
             gdb.TYPE_CODE_UNION : CompoundExplorer,
             gdb.TYPE_CODE_PTR : PointerExplorer,
-            gdb.TYPE_CODE_REF : ReferenceExplorer,
-            gdb.TYPE_CODE_RVALUE_REF : ReferenceExplorer,
-            gdb.TYPE_CODE_TYPEDEF : TypedefExplorer,
             gdb.TYPE_CODE_ARRAY : ArrayExplorer
         }
+        # Resolve the explorer functions up front so that dispatching on
+        # every step of an exploration is a single map lookup.
+        Explorer.type_code_to_expr_explorer_map = dict(
+            (code, explorer_class.explore_expr) for code, explorer_class
+            in Explorer.type_code_to_explorer_map.items())
+        Explorer.type_code_to_type_explorer_map = dict(
+            (code, explorer_class.explore_type) for code, explorer_class
+            in Explorer.type_code_to_explorer_map.items())
+
+    @staticmethod
+    def type_to_str(datatype):
+        """Returns the string representation of a type.  As formatting a
+        type is costly for GDB, the result is cached per gdb.Type object.
+
+        Arguments:
+            datatype: The gdb.Type value to be converted to a string.
+
+        Returns:
+            str(datatype)
+        """
+        entry = Explorer._type_str_cache.get(id(datatype))
+        if entry is None:
+            entry = (datatype, str(datatype))
+            Explorer._type_str_cache[id(datatype)] = entry
+        return entry[1]
 
     @staticmethod
     def is_scalar_type(type):
@@ -154,7 +218,7 @@ class Explorer(object):
         Returns:
             'True' if 'type' is a scalar type. 'False' otherwise.
         """
-        return type.code in Explorer._SCALAR_TYPE_LIST
+        return type.code in Explorer._SCALAR_TYPE_SET
 
     @staticmethod
     def return_to_parent_value():
@@ -190,6 +254,17 @@ class Explorer(object):
 class ScalarExplorer(object):
     """Internal class used to explore scalar values."""
 
+    __slots__ = ()
+
+    # Messages printed by explore_type, indexed by whether the type is an
+    # enum and whether it is a child.
+    _TYPE_DESC_FORMATS = {
+        (True, True): "{name} is of an enumerated type '{datatype}'.",
+        (True, False): "'{name}' is an enumerated type.",
+        (False, True): "{name} is of a scalar type '{datatype}'.",
+        (False, False): "'{name}' is a scalar type.",
+    }
+
     @staticmethod
     def explore_expr(expr, value, is_child):
         """Function to explore scalar values.
@@ -212,18 +287,11 @@ class ScalarExplorer(object):
         See Explorer.explore_type and Explorer.is_scalar_type for more
         information.
         """
-        if datatype.code == gdb.TYPE_CODE_ENUM:
-            if is_child:
-                print ("%s is of an enumerated type '%s'." %
-                       (name, str(datatype)))
-            else:
-                print ("'%s' is an enumerated type." % name)
-        else:
-            if is_child:
-                print ("%s is of a scalar type '%s'." %
-                       (name, str(datatype)))
-            else:
-                print ("'%s' is a scalar type." % name)
+        is_enum = (datatype.code == gdb.TYPE_CODE_ENUM)
+        # str.format only converts the fields present in the message, so
+        # the type is formatted only when it is printed.
+        print (ScalarExplorer._TYPE_DESC_FORMATS[(is_enum, bool(is_child))]
+               .format(name=name, datatype=datatype))
 
         if is_child:
             Explorer.return_to_enclosing_type_prompt()
@@ -235,6 +303,8 @@ class ScalarExplorer(object):
 class PointerExplorer(object):
     """Internal class used to explore pointer values."""
 
+    __slots__ = ()
+
     @staticmethod
     def explore_expr(expr, value, is_child):
         """Function to explore pointer values.
@@ -248,7 +318,9 @@ class PointerExplorer(object):
             deref_value = None
             try:
                 deref_value = value.dereference()
-                str(deref_value)
+                # Only read the pointee to check that it is accessible;
+                # formatting it would needlessly print the whole value.
+                deref_value.fetch_lazy()
             except gdb.MemoryError:
                 print ("'%s' a pointer pointing to an invalid memory "
                        "location." % expr)
@@ -262,6 +334,7 @@ class PointerExplorer(object):
         option  = raw_input("Continue exploring it as a pointer to an "
                             "array [y/n]: ")
         if option == "y":
+            guarded_expr = Explorer.guard_expr(expr)
             while True:
                 index = 0
                 try:
@@ -269,14 +342,14 @@ class PointerExplorer(object):
                                           "want to explore in '%s': " % expr))
                 except ValueError:
                     break
-                element_expr = "%s[%d]" % (Explorer.guard_expr(expr), index)
                 element = value[index]
                 try:
-                    str(element)
+                    element.fetch_lazy()
                 except gdb.MemoryError:
                     print ("Cannot read value at index %d." % index)
                     continue
-                Explorer.explore_expr(element_expr, element, True)
+                Explorer.explore_expr("%s[%d]" % (guarded_expr, index),
+                                      element, True)
             return False
 
         if is_child:
@@ -298,30 +371,11 @@ class PointerExplorer(object):
         return False
 
 
-class ReferenceExplorer(object):
-    """Internal class used to explore reference (TYPE_CODE_REF) values."""
-
-    @staticmethod
-    def explore_expr(expr, value, is_child):
-        """Function to explore array values.
-        See Explorer.explore_expr for more information.
-        """
-        referenced_value = value.referenced_value()
-        Explorer.explore_expr(expr, referenced_value, is_child)
-        return False
-
-    @staticmethod
-    def explore_type(name, datatype, is_child):
-        """Function to explore pointer types.
-        See Explorer.explore_type for more information.
-        """
-        target_type = datatype.target()
-        Explorer.explore_type(name, target_type, is_child)
-        return False
-
 class ArrayExplorer(object):
     """Internal class used to explore arrays."""
 
+    __slots__ = ()
+
     @staticmethod
     def explore_expr(expr, value, is_child):
         """Function to explore array values.
@@ -341,7 +395,7 @@ class ArrayExplorer(object):
         element = None
         try:
             element = value[index]
-            str(element)
+            element.fetch_lazy()
         except gdb.MemoryError:
             print ("Cannot read value at index %d." % index)
             raw_input("Press enter to continue... ")
@@ -367,26 +421,44 @@ class ArrayExplorer(object):
 class CompoundExplorer(object):
     """Internal class used to explore struct, classes and unions."""
 
+    __slots__ = ()
+
+    # Cache of the real fields of the compound types explored by the current
+    # explore command, keyed by the id of the gdb.Type object, which is held
+    # along with them.  Reusing the same field gdb.Type objects also lets
+    # Explorer.type_to_str hit when a compound is displayed again after
+    # exploring one of its fields.  It is cleared by ExploreUtils.clear_caches
+    # at the end of each explore command.
+    _real_fields_cache = { }
+
     @staticmethod
-    def _print_fields(print_list):
-        """Internal function which prints the fields of a struct/class/union.
+    def _get_real_fields(datatype):
+        """Internal function which returns a (name, type, is_base_class)
+        tuple for each non-artificial field of a struct/class/union type.
         """
-        max_field_name_length = 0
-        for pair in print_list:
-            if max_field_name_length < len(pair[0]):
-                max_field_name_length = len(pair[0])
-
-        for pair in print_list:
-            print ("  %*s = %s" % (max_field_name_length, pair[0], pair[1]))
+        entry = CompoundExplorer._real_fields_cache.get(id(datatype))
+        if entry is None:
+            # Fetch the field attributes from GDB only once per field.
+            real_fields = [(field.name, field.type, field.is_base_class)
+                           for field in datatype.fields()
+                           if not field.artificial]
+            entry = (datatype, real_fields)
+            CompoundExplorer._real_fields_cache[id(datatype)] = entry
+        return entry[1]
 
     @staticmethod
-    def _get_real_field_count(fields):
-        real_field_count = 0;
-        for field in fields:
-            if not field.artificial:
-                real_field_count = real_field_count + 1
+    def _print_fields(header, print_list):
+        """Internal function which prints the fields of a struct/class/union,
+        preceded by the line 'header' and followed by an empty line.
+        """
+        max_field_name_length = max(len(name) for name, _ in print_list)
 
-        return real_field_count
+        lines = [header]
+        lines.extend("  " + name.rjust(max_field_name_length) + " = " + literal
+                     for name, literal in print_list)
+        # Emit everything with a single write to GDB rather than one print
+        # per line.
+        sys.stdout.write("\n".join(lines) + "\n\n")
 
     @staticmethod
     def explore_expr(expr, value, is_child):
@@ -395,70 +467,77 @@ class CompoundExplorer(object):
         """
         datatype = value.type
         type_code = datatype.code
-        fields = datatype.fields()
+        is_union = (type_code == gdb.TYPE_CODE_UNION)
 
         if type_code == gdb.TYPE_CODE_STRUCT:
             type_desc = "struct/class"
         else:
             type_desc = "union"
 
-        if CompoundExplorer._get_real_field_count(fields) == 0:
+        real_fields = CompoundExplorer._get_real_fields(datatype)
+
+        if not real_fields:
             print ("The value of '%s' is a %s of type '%s' with no fields." %
-                   (expr, type_desc, str(value.type)))
+                   (expr, type_desc, Explorer.type_to_str(datatype)))
             if is_child:
                 Explorer.return_to_parent_value_prompt()
             return False
 
-        print ("The value of '%s' is a %s of type '%s' with the following "
-              "fields:\n" % (expr, type_desc, str(value.type)))
+        header = ("The value of '%s' is a %s of type '%s' with the following "
+                  "fields:\n" %
+                  (expr, type_desc, Explorer.type_to_str(datatype)))
+
+        scalar_type_codes = Explorer._SCALAR_TYPE_SET
 
         has_explorable_fields = False
-        choice_to_compound_field_map = { }
-        current_choice = 0
+        field_entries = [ ]
         print_list = [ ]
-        for field in fields:
-            if field.artificial:
-                continue
-            field_full_name = Explorer.guard_expr(expr) + "." + field.name
-            if field.is_base_class:
-                field_value = value.cast(field.type)
+        for current_choice, real_field in enumerate(real_fields):
+            field_name, field_type, field_is_base_class = real_field
+            if field_is_base_class:
+                field_value = value.cast(field_type)
             else:
-                field_value = value[field.name]
+                field_value = value[field_name]
             literal_value = ""
-            if type_code == gdb.TYPE_CODE_UNION:
+            if is_union:
                 literal_value = ("<Enter %d to explore this field of type "
-                                 "'%s'>" % (current_choice, str(field.type)))
+                                 "'%s'>" %
+                                 (current_choice,
+                                  Explorer.type_to_str(field_type)))
                 has_explorable_fields = True
             else:
-                if Explorer.is_scalar_type(field.type):
+                # This is Explorer.is_scalar_type, inlined for the loop.
+                if field_type.code in scalar_type_codes:
                     literal_value = ("%s .. (Value of type '%s')" %
-                                     (str(field_value), str(field.type)))
+                                     (str(field_value),
+                                      Explorer.type_to_str(field_type)))
                 else:
-                    if field.is_base_class:
+                    if field_is_base_class:
                         field_desc = "base class"
                     else:
                         field_desc = "field"
                     literal_value = ("<Enter %d to explore this %s of type "
                                      "'%s'>" %
                                      (current_choice, field_desc,
-                                      str(field.type)))
+                                      Explorer.type_to_str(field_type)))
                     has_explorable_fields = True
 
-            choice_to_compound_field_map[str(current_choice)] = (
-                field_full_name, field_value)
-            current_choice = current_choice + 1
+            field_entries.append((field_name, field_value))
+            print_list.append((field_name, literal_value))
 
-            print_list.append((field.name, literal_value))
+        choice_to_compound_field_map = {
+            str(choice): entry for choice, entry in enumerate(field_entries)
+        }
 
-        CompoundExplorer._print_fields(print_list)
-        print ("")
+        CompoundExplorer._print_fields(header, print_list)
 
         if has_explorable_fields:
             choice = raw_input("Enter the field number of choice: ")
-            if choice in choice_to_compound_field_map:
-                Explorer.explore_expr(choice_to_compound_field_map[choice][0],
-                                      choice_to_compound_field_map[choice][1],
-                                      True)
+            entry = choice_to_compound_field_map.get(choice)
+            if entry is not None:
+                # Only the chosen field needs its full expression.
+                field_full_name = Explorer.guard_expr(expr) + "." + entry[0]
+                Explorer.explore_expr(field_full_name, entry[1], True)
                 return True
             else:
                 if is_child:
@@ -481,61 +560,57 @@ class CompoundExplorer(object):
         else:
             type_desc = "union"
 
-        fields = datatype.fields()
-        if CompoundExplorer._get_real_field_count(fields) == 0:
+        real_fields = CompoundExplorer._get_real_fields(datatype)
+
+        if not real_fields:
             if is_child:
                 print ("%s is a %s of type '%s' with no fields." %
-                       (name, type_desc, str(datatype)))
+                       (name, type_desc, Explorer.type_to_str(datatype)))
                 Explorer.return_to_enclosing_type_prompt()
             else:
                 print ("'%s' is a %s with no fields." % (name, type_desc))
             return False
 
         if is_child:
-            print ("%s is a %s of type '%s' "
-                   "with the following fields:\n" %
-                   (name, type_desc, str(datatype)))
+            header = ("%s is a %s of type '%s' "
+                      "with the following fields:\n" %
+                      (name, type_desc, Explorer.type_to_str(datatype)))
         else:
-            print ("'%s' is a %s with the following "
-                   "fields:\n" %
-                   (name, type_desc))
+            header = ("'%s' is a %s with the following "
+                      "fields:\n" %
+                      (name, type_desc))
 
-        has_explorable_fields = False
-        current_choice = 0
-        choice_to_compound_field_map = { }
+        field_entries = [ ]
         print_list = [ ]
-        for field in fields:
-            if field.artificial:
-                continue
-            if field.is_base_class:
+        for current_choice, real_field in enumerate(real_fields):
+            field_name, field_type, field_is_base_class = real_field
+            if field_is_base_class:
                 field_desc = "base class"
             else:
                 field_desc = "field"
             rhs = ("<Enter %d to explore this %s of type '%s'>" %
-                   (current_choice, field_desc, str(field.type)))
-            print_list.append((field.name, rhs))
-            choice_to_compound_field_map[str(current_choice)] = (
-                field.name, field.type, field_desc)
-            current_choice = current_choice + 1
+                   (current_choice, field_desc,
+                    Explorer.type_to_str(field_type)))
+            print_list.append((field_name, rhs))
+            field_entries.append((field_name, field_type, field_desc))
+
+        choice_to_compound_field_map = {
+            str(choice): entry for choice, entry in enumerate(field_entries)
+        }
 
-        CompoundExplorer._print_fields(print_list)
-        print ("")
+        CompoundExplorer._print_fields(header, print_list)
 
         if len(choice_to_compound_field_map) > 0:
             choice = raw_input("Enter the field number of choice: ")
-            if choice in choice_to_compound_field_map:
+            entry = choice_to_compound_field_map.get(choice)
+            if entry is not None:
                 if is_child:
-                    new_name = ("%s '%s' of %s" % 
-                                (choice_to_compound_field_map[choice][2],
-                                 choice_to_compound_field_map[choice][0],
-                                 name))
+                    new_name = ("%s '%s' of %s" %
+                                (entry[2], entry[0], name))
                 else:
-                    new_name = ("%s '%s' of '%s'" % 
-                                (choice_to_compound_field_map[choice][2],
-                                 choice_to_compound_field_map[choice][0],
-                                 name))
-                Explorer.explore_type(new_name,
-                    choice_to_compound_field_map[choice][1], True)
+                    new_name = ("%s '%s' of '%s'" %
+                                (entry[2], entry[0], name))
+                Explorer.explore_type(new_name, entry[1], True)
                 return True
             else:
                 if is_child:
@@ -547,42 +622,11 @@ class CompoundExplorer(object):
         return False
            
 
-class TypedefExplorer(object):
-    """Internal class used to explore values whose type is a typedef."""
-
-    @staticmethod
-    def explore_expr(expr, value, is_child):
-        """Function to explore typedef values.
-        See Explorer.explore_expr for more information.
-        """
-        actual_type = value.type.strip_typedefs()
-        print ("The value of '%s' is of type '%s' "
-               "which is a typedef of type '%s'" %
-               (expr, str(value.type), str(actual_type)))
-
-        Explorer.explore_expr(expr, value.cast(actual_type), is_child)
-        return False
-
-    @staticmethod
-    def explore_type(name, datatype, is_child):
-        """Function to explore typedef types.
-        See Explorer.explore_type for more information.
-        """
-        actual_type = datatype.strip_typedefs()
-        if is_child:
-            print ("The type of %s is a typedef of type '%s'." %
-                   (name, str(actual_type)))
-        else:
-            print ("The type '%s' is a typedef of type '%s'." %
-                   (name, str(actual_type)))
-
-        Explorer.explore_type(name, actual_type, is_child)
-        return False
-
-
 class ExploreUtils(object):
     """Internal class which provides utilities for the main command classes."""
 
+    __slots__ = ()
+
     @staticmethod
     def check_args(name, arg_str):
         """Utility to check if adequate number of arguments are passed to an
@@ -628,6 +672,15 @@ class ExploreUtils(object):
             except RuntimeError:
                 return None
 
+    @staticmethod
+    def clear_caches():
+        """Clears the caches of type strings and fields used by the
+        explorers.  The gdb.Type objects of one explore command are not
+        reused by the next, so this is done when each command finishes.
+        """
+        Explorer._type_str_cache.clear()
+        CompoundExplorer._real_fields_cache.clear()
+
     @staticmethod
     def get_value_from_str(value_str):
         """A utility function to deduce the gdb.Value value from a string
@@ -667,13 +720,19 @@ choice, if any) to return to the enclosing type or value."""
         # Check if it is a value
         value = ExploreUtils.get_value_from_str(arg_str)
         if value is not None:
-            Explorer.explore_expr(arg_str, value, False)
+            try:
+                Explorer.explore_expr(arg_str, value, False)
+            finally:
+                ExploreUtils.clear_caches()
             return
 
         # If it is not a value, check if it is a type
         datatype = ExploreUtils.get_type_from_str(arg_str)
         if datatype is not None:
-            Explorer.explore_type(arg_str, datatype, False)
+            try:
+                Explorer.explore_type(arg_str, datatype, False)
+            finally:
+                ExploreUtils.clear_caches()
             return
 
         # If it is neither a value nor a type, raise an error.
@@ -708,7 +767,10 @@ choice, if any) to return to the enclosing value."""
                  arg_str))
             return
 
-        Explorer.explore_expr(arg_str, value, False)
+        try:
+            Explorer.explore_expr(arg_str, value, False)
+        finally:
+            ExploreUtils.clear_caches()
 
 
 class ExploreTypeCommand(gdb.Command):            
@@ -730,13 +792,19 @@ choice, if any) to return to the enclosing type."""
 
         datatype = ExploreUtils.get_type_from_str(arg_str)
         if datatype is not None:
-            Explorer.explore_type(arg_str, datatype, False)
+            try:
+                Explorer.explore_type(arg_str, datatype, False)
+            finally:
+                ExploreUtils.clear_caches()
             return
 
         value = ExploreUtils.get_value_from_str(arg_str)
         if value is not None:
             print ("'%s' is of type '%s'." % (arg_str, str(value.type)))
-            Explorer.explore_type(str(value.type), value.type, False)
+            try:
+                Explorer.explore_type(str(value.type), value.type, False)
+            finally:
+                ExploreUtils.clear_caches()
             return
 
         raise gdb.GdbError(("'%s' is not a type or value in the current "